@@ -1,9 +1,12 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 import plotly.graph_objects as go
+import polars as pl
 from datetime import datetime, timedelta
 import io
+import hashlib
+import uuid
 
 # Page Configuration
 st.set_page_config(
@@ -282,26 +285,67 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# Columns read by the KPIs, charts and alerts
+DASHBOARD_COLUMNS = [
+    'Equipment Description', 'Vendor', 'Current Status', 'Category',
+    'Payment Type', 'Billing Basis', 'Unit Rate', 'Quantity', 'Planned Duration (Days)',
+    'Last Inspection Date', 'Next Inspection Due', 'Mobilization Date',
+    'Planned Demob Date', 'Actual Demob Date'
+]
+
 # Load and process data
-@st.cache_data
-def load_data(file):
-    """Load and process equipment data"""
-    df = pd.read_excel(file) if file.name.endswith('.xlsx') else pd.read_csv(file)
+def load_data(file, dashboard_columns_only=False):
+    """Load and process an uploaded equipment file, returning (df, load_key)"""
+    data = file.getvalue()
+    file_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+    is_excel = file.name.endswith(('.xlsx', '.xls'))
+    # usecols is only passed to the Excel reader; a CSV always loads in full
+    dashboard_columns_only = dashboard_columns_only and is_excel
+    if dashboard_columns_only:
+        # A column-projected load is a different frame, so it gets its own key
+        file_hash += '-dashboard'
+    
+    return load_data_bytes(file_hash, is_excel, dashboard_columns_only, data)
+
+# Cached as a resource so reruns share one frame instead of unpickling a copy;
+# callers must treat the returned dataframe as read-only
+@st.cache_resource(max_entries=4)
+def load_data_bytes(file_hash, is_excel, dashboard_columns_only, _data):
+    """Load and process equipment data from raw file bytes, returning (df, load_key)"""
+    if is_excel:
+        # calamine still reads every cell; usecols only drops unused columns before
+        # the per-column processing below, which trims load time and memory slightly
+        usecols = (lambda col: str(col).strip() in DASHBOARD_COLUMNS) if dashboard_columns_only else None
+        df = pd.read_excel(io.BytesIO(_data), engine='calamine', usecols=usecols)
+    else:
+        # The default C engine pads short rows with NaN and renames duplicate or
+        # blank headers ('Vendor.1', 'Unnamed: n'); the pyarrow engine rejects them
+        df = pd.read_csv(io.BytesIO(_data))
     
     # Clean column names
-    df.columns = df.columns.str.strip()
+    df.columns = [str(col).strip() for col in df.columns]
     
     # Convert date columns
     date_cols = ['Last Inspection Date', 'Next Inspection Due', 
                  'Mobilization Date', 'Planned Demob Date', 'Actual Demob Date']
     for col in date_cols:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors='coerce')
+        # Excel date cells already arrive as datetime64; only parse text columns.
+        # pandas infers the format from the first value, and cache=True parses
+        # each distinct date string once.
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce', cache=True)
+        # ISO '...Z' strings parse tz-aware; store naive UTC so comparisons
+        # against the local clock don't raise
+        if col in df.columns and isinstance(df[col].dtype, pd.DatetimeTZDtype):
+            df[col] = df[col].dt.tz_convert(None)
     
     # Calculate days onsite
     if 'Mobilization Date' in df.columns:
-        df['Days Onsite'] = (datetime.now() - df['Mobilization Date']).dt.days
-        df['Days Onsite'] = df['Days Onsite'].clip(lower=0).fillna(0)
+        # Whole days elapsed, computed on int64 nanoseconds; missing dates count as 0
+        mobilized = df['Mobilization Date'].to_numpy(dtype='datetime64[ns]')
+        now_ns = np.datetime64(datetime.now(), 'ns').astype(np.int64)
+        elapsed_days = (now_ns - mobilized.view(np.int64)) // 86_400_000_000_000
+        df['Days Onsite'] = np.where(np.isnat(mobilized), 0, np.maximum(elapsed_days, 0))
     
     # Calculate variance
     if 'Planned Duration (Days)' in df.columns and 'Days Onsite' in df.columns:
@@ -316,59 +360,131 @@ def load_data(file):
     
     # Calculate total cost estimate
     if 'Unit Rate' in df.columns and 'Days Onsite' in df.columns and 'Billing Basis' in df.columns:
-        df['Estimated Total Cost'] = 0.0
+        days = df['Days Onsite'].fillna(0).to_numpy(dtype=float)
+        rate = df['Unit Rate'].fillna(0).to_numpy(dtype=float)
+        billing_basis = df['Billing Basis'].astype('category')
         
-        for idx, row in df.iterrows():
-            try:
-                days = float(row['Days Onsite']) if pd.notnull(row['Days Onsite']) else 0
-                rate = float(row['Unit Rate']) if pd.notnull(row['Unit Rate']) else 0
-                
-                if pd.notnull(row['Billing Basis']) and days > 0 and rate > 0:
-                    billing_basis = str(row['Billing Basis']).lower()
-                    
-                    if 'daily' in billing_basis:
-                        df.at[idx, 'Estimated Total Cost'] = days * rate
-                    elif 'weekly' in billing_basis:
-                        df.at[idx, 'Estimated Total Cost'] = (days / 7) * rate
-                    elif 'monthly' in billing_basis:
-                        df.at[idx, 'Estimated Total Cost'] = (days / 30) * rate
-                    else:
-                        df.at[idx, 'Estimated Total Cost'] = days * rate
-            except:
-                df.at[idx, 'Estimated Total Cost'] = 0.0
+        # Resolve the divisor once per distinct billing basis, then gather it per
+        # row by category code. Daily is the default when the basis is not
+        # recognised; the trailing slot is picked by code -1 (missing basis).
+        labels = billing_basis.cat.categories.astype(str).str.lower()
+        divisor_lut = np.append(
+            np.select(
+                [labels.str.contains('daily', regex=False),
+                 labels.str.contains('weekly', regex=False),
+                 labels.str.contains('monthly', regex=False)],
+                [1.0, 7.0, 30.0],
+                default=1.0
+            ),
+            1.0
+        )
+        codes = billing_basis.cat.codes.to_numpy()
+        divisor = divisor_lut[codes]
+        
+        billable = (codes >= 0) & (days > 0) & (rate > 0)
+        
+        # Multiply and zero in place so only one cost array is allocated
+        cost = days / divisor
+        cost *= rate
+        cost[~billable] = 0.0
+        df['Estimated Total Cost'] = cost
+    
+    # Store low-cardinality text columns as categoricals; equipment descriptions
+    # repeat across a fleet (e.g. several identical excavators) so they qualify too
+    categorical_cols = ['Vendor', 'Current Status', 'Category', 'Payment Type', 'Billing Basis',
+                        'Equipment Description']
+    for col in categorical_cols:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    
+    # Move remaining all-text columns to Arrow-backed strings so .str ops run
+    # in Arrow kernels; mixed-type columns are left as object
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) == 'string':
+            df[col] = df[col].astype('string[pyarrow]')
+    
+    # Shrink whole-number columns; downcast leaves fractional values as float
+    integer_cols = ['Quantity', 'Days Onsite', 'Duration Variance']
+    for col in integer_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
     
-    return df
+    # Days Onsite and costs depend on when the file was parsed, so a re-parse after
+    # eviction gets a fresh key and derived caches never mix it with an old frame
+    load_key = f"{file_hash}-{uuid.uuid4().hex[:8]}"
+    return df, load_key
+
+def count_status(status_counts, keyword):
+    """Sum status counts whose label contains keyword (case-insensitive)"""
+    status_labels = status_counts.index.astype(str).str.lower()
+    return int(status_counts[status_labels.str.contains(keyword, regex=False)].sum())
+
+def category_mask(series, value):
+    """Boolean array of rows equal to value, compared on categorical codes"""
+    try:
+        code = series.cat.categories.get_loc(value)
+    except KeyError:
+        return np.zeros(len(series), dtype=bool)
+    return series.cat.codes.to_numpy() == code
 
-def calculate_kpis(df):
-    """Calculate key performance indicators"""
-    total_equipment = len(df)
-    
-    if 'Current Status' in df.columns:
-        # Convert to string and handle NaN values
-        status_series = df['Current Status'].astype(str).str.lower()
-        active = len(df[status_series.str.contains('active', na=False)])
-        idle = len(df[status_series.str.contains('idle', na=False)])
-        maintenance = len(df[status_series.str.contains('maintenance', na=False)])
+# Keyed on the load key rather than the frame's contents, and shared by
+# reference like load_data_bytes, so repeat filter states cost nothing
+@st.cache_resource(max_entries=32, show_spinner=False)
+def filter_data(_df, load_key, filter_key):
+    """Apply sidebar filter selections (vendor, status, category, payment type)"""
+    selected_vendor, selected_status, selected_category, selected_payment = filter_key
+    
+    # With no filters active the full frame is returned as-is, without a copy
+    if all(selection == 'All' for selection in filter_key):
+        return _df
+    
+    # Combine all selections into one mask and slice the frame once
+    mask = np.ones(len(_df), dtype=bool)
+    if selected_vendor != 'All':
+        mask &= category_mask(_df['Vendor'], selected_vendor)
+    if selected_status != 'All':
+        mask &= category_mask(_df['Current Status'], selected_status)
+    if selected_category != 'All':
+        mask &= category_mask(_df['Category'], selected_category)
+    if selected_payment != 'All':
+        mask &= category_mask(_df['Payment Type'], selected_payment)
+    
+    return _df[mask]
+
+def find_alert_masks(df, now):
+    """Return boolean arrays flagging overdue inspections and items >7 days over plan"""
+    # load_data has already parsed the dates and variance, so compare the raw
+    # numpy arrays directly; NaT and NaN compare False
+    no_alerts = np.zeros(len(df), dtype=bool)
+    
+    overdue_mask = no_alerts
+    if 'Next Inspection Due' in df.columns:
+        overdue_mask = df['Next Inspection Due'].to_numpy() < now.to_datetime64()
+    
+    over_duration_mask = no_alerts
+    if 'Duration Variance' in df.columns:
+        over_duration_mask = df['Duration Variance'].to_numpy() > 7
+    
+    return overdue_mask, over_duration_mask
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def calculate_kpis(_df, data_key, now):
+    """Calculate key performance indicators as of now"""
+    total_equipment = len(_df)
+    
+    if 'Current Status' in _df.columns:
+        status_counts = _df['Current Status'].value_counts()
+        active = count_status(status_counts, 'active')
+        idle = count_status(status_counts, 'idle')
+        maintenance = count_status(status_counts, 'maintenance')
     else:
         active = idle = maintenance = 0
     
-    total_cost = df['Estimated Total Cost'].sum() if 'Estimated Total Cost' in df.columns else 0
+    total_cost = _df['Estimated Total Cost'].sum() if 'Estimated Total Cost' in _df.columns else 0
     
     # Count alerts
-    alerts = 0
-    if 'Next Inspection Due' in df.columns:
-        try:
-            overdue = pd.to_datetime(df['Next Inspection Due'], errors='coerce') < datetime.now()
-            alerts += overdue.sum()
-        except:
-            pass
-    
-    if 'Duration Variance' in df.columns:
-        try:
-            over_duration = pd.to_numeric(df['Duration Variance'], errors='coerce') > 7
-            alerts += over_duration.sum()
-        except:
-            pass
+    overdue_mask, over_duration_mask = find_alert_masks(_df, now)
+    alerts = int(np.count_nonzero(overdue_mask) + np.count_nonzero(over_duration_mask))
     
     return {
         'total': total_equipment,
@@ -379,21 +495,53 @@ def calculate_kpis(df):
         'alerts': alerts
     }
 
-def create_status_chart(df):
+def limit_pie_slices(counts, max_slices=6):
+    """Keep the largest pie slices and roll the remainder into 'Other'"""
+    if len(counts) <= max_slices:
+        return counts
+    
+    other = pd.Series({'Other': counts.iloc[max_slices:].sum()})
+    return pd.concat([counts.iloc[:max_slices], other])
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def calculate_vendor_summary(_df, data_key):
+    """Summarize equipment count, cost and average days onsite per vendor, highest cost first"""
+    vendor = _df['Vendor'].astype('category')
+    
+    # Aggregate in Polars on the integer vendor codes, so vendor names and
+    # free-text descriptions never need converting; missing vendors are code -1
+    vendor_summary = pl.DataFrame({
+        'Vendor Code': vendor.cat.codes.to_numpy(),
+        'Has Description': _df['Equipment Description'].notna().to_numpy(),
+        'Estimated Total Cost': _df['Estimated Total Cost'].to_numpy(),
+        'Days Onsite': _df['Days Onsite'].to_numpy()
+    }).group_by('Vendor Code').agg(
+        pl.col('Has Description').sum().alias('Equipment Count'),
+        pl.col('Estimated Total Cost').sum().alias('Total Cost'),
+        pl.col('Days Onsite').mean().alias('Avg Days Onsite')
+    ).sort('Total Cost', descending=True).to_pandas()
+    
+    vendor_codes = vendor_summary.pop('Vendor Code')
+    vendor_summary.insert(0, 'Vendor', pd.Categorical.from_codes(vendor_codes, vendor.cat.categories))
+    return vendor_summary
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def create_status_chart(_df, data_key):
     """Create equipment status distribution chart"""
-    if 'Current Status' not in df.columns:
+    if 'Current Status' not in _df.columns:
         return None
     
     # Convert to string and clean data
-    status_clean = df['Current Status'].astype(str).replace('nan', 'Unknown')
-    status_counts = status_clean.value_counts()
+    status_clean = _df['Current Status'].astype(str).replace('nan', 'Unknown')
+    status_counts = limit_pie_slices(status_clean.value_counts())
     
     colors = {
         'Active': '#4CAF50',
         'Idle': '#FF9800',
         'Under Maintenance': '#FFEB3B',
         'Demobilized': '#757575',
-        'Unknown': '#BDBDBD'
+        'Unknown': '#BDBDBD',
+        'Other': '#9E9E9E'
     }
     
     fig = go.Figure(data=[go.Pie(
@@ -415,18 +563,14 @@ def create_status_chart(df):
     
     return fig
 
-def create_vendor_chart(df):
+@st.cache_data(max_entries=32, show_spinner=False)
+def create_vendor_chart(_df, data_key):
     """Create vendor analysis chart"""
-    if 'Vendor' not in df.columns:
+    if 'Vendor' not in _df.columns:
         return None
     
-    vendor_data = df.groupby('Vendor').agg({
-        'Equipment Description': 'count',
-        'Estimated Total Cost': 'sum'
-    }).reset_index()
-    
-    vendor_data.columns = ['Vendor', 'Equipment Count', 'Total Cost']
-    vendor_data = vendor_data.sort_values('Total Cost', ascending=False).head(10)
+    vendor_data = calculate_vendor_summary(_df, data_key).dropna(subset=['Vendor']).head(10)
+    vendor_data['Vendor'] = vendor_data['Vendor'].astype(str)
     
     fig = go.Figure(data=[
         go.Bar(
@@ -454,45 +598,84 @@ def create_vendor_chart(df):
     
     return fig
 
-def create_timeline_chart(df):
-    """Create equipment timeline"""
-    if 'Mobilization Date' not in df.columns or 'Equipment Description' not in df.columns:
+@st.cache_data(max_entries=32, show_spinner=False)
+def create_timeline_chart(_df, data_key, now, max_rows=None):
+    """Create equipment timeline, limited to the longest max_rows items"""
+    if 'Mobilization Date' not in _df.columns or 'Equipment Description' not in _df.columns:
         return None
     
-    timeline_df = df[['Equipment Description', 'Vendor', 'Mobilization Date', 
-                      'Planned Demob Date', 'Current Status']].copy()
-    timeline_df = timeline_df.dropna(subset=['Mobilization Date'])
+    # Row mask and column list in one .loc call yields a new frame, no copy needed
+    timeline_cols = ['Equipment Description', 'Vendor', 'Mobilization Date', 
+                     'Planned Demob Date', 'Current Status']
+    timeline_df = _df.loc[_df['Mobilization Date'].notna(), timeline_cols]
     
     if len(timeline_df) == 0:
         return None
     
     # Use actual or planned demob date
-    timeline_df['End Date'] = timeline_df['Planned Demob Date'].fillna(datetime.now() + timedelta(days=30))
+    timeline_df['End Date'] = timeline_df['Planned Demob Date'].fillna(now + timedelta(days=30))
+    
+    # Plotly slows sharply with one bar per row, so keep only the longest stays
+    # and draw everything else as one min-to-max span per vendor
+    title = 'Equipment Timeline'
+    total_rows = len(timeline_df)
+    if max_rows is not None and total_rows > max_rows:
+        duration = timeline_df['End Date'] - timeline_df['Mobilization Date']
+        longest = duration.nlargest(max_rows).index
+        
+        vendor_spans = timeline_df.drop(index=longest).groupby('Vendor', observed=True, dropna=False).agg(**{
+            'Mobilization Date': ('Mobilization Date', 'min'),
+            'End Date': ('End Date', 'max'),
+            'Items': ('Mobilization Date', 'size')
+        }).reset_index()
+        vendor_names = vendor_spans['Vendor'].astype(str).replace('nan', 'Unknown')
+        vendor_spans['Equipment Description'] = vendor_names + ' (' + vendor_spans['Items'].astype(str) + ' more items)'
+        vendor_spans['Current Status'] = 'Other'
+        
+        timeline_df = pd.concat([timeline_df.loc[longest], vendor_spans.drop(columns='Items')], ignore_index=True)
+        title = f'Equipment Timeline (longest {max_rows} of {total_rows}, rest grouped by vendor)'
     
     # Clean status column
     timeline_df['Current Status'] = timeline_df['Current Status'].astype(str).replace('nan', 'Unknown')
     
-    fig = px.timeline(
-        timeline_df,
-        x_start='Mobilization Date',
-        x_end='End Date',
-        y='Equipment Description',
-        color='Current Status',
-        hover_data=['Vendor'],
-        color_discrete_map={
-            'Active': '#4CAF50',
-            'Idle': '#FF9800',
-            'Under Maintenance': '#FFEB3B',
-            'Demobilized': '#757575',
-            'Unknown': '#BDBDBD'
-        }
-    )
+    colors = {
+        'Active': '#4CAF50',
+        'Idle': '#FF9800',
+        'Under Maintenance': '#FFEB3B',
+        'Demobilized': '#757575',
+        'Unknown': '#BDBDBD',
+        'Other': '#9E9E9E'
+    }
+    
+    # One horizontal bar trace per status, built straight from the arrays:
+    # bars start at the mobilization date and run for the duration in ms
+    fig = go.Figure()
+    for status, status_df in timeline_df.groupby('Current Status', sort=False):
+        start = status_df['Mobilization Date']
+        end = status_df['End Date']
+        fig.add_bar(
+            y=status_df['Equipment Description'].astype(str),
+            base=start,
+            x=(end - start).dt.total_seconds() * 1000,
+            orientation='h',
+            name=status,
+            marker_color=colors.get(status, '#1B4D89'),
+            customdata=np.column_stack([
+                status_df['Vendor'].astype(str),
+                start.dt.strftime('%Y-%m-%d'),
+                end.dt.strftime('%Y-%m-%d')
+            ]),
+            hovertemplate='<b>%{y}</b><br>Vendor: %{customdata[0]}<br>'
+                          'Start: %{customdata[1]}<br>End: %{customdata[2]}<extra>%{fullData.name}</extra>'
+        )
     
     fig.update_layout(
-        title='Equipment Timeline',
+        title=title,
         height=600,
         xaxis_title='Date',
         yaxis_title='Equipment',
+        xaxis_type='date',
+        barmode='overlay',
         showlegend=True,
         paper_bgcolor='white',
         plot_bgcolor='white'
@@ -502,12 +685,14 @@ def create_timeline_chart(df):
     
     return fig
 
-def create_category_chart(df):
+@st.cache_data(max_entries=32, show_spinner=False)
+def create_category_chart(_df, data_key):
     """Create category distribution"""
-    if 'Category' not in df.columns:
+    if 'Category' not in _df.columns:
         return None
     
-    category_counts = df['Category'].value_counts().head(10)
+    category_counts = _df['Category'].value_counts()
+    category_counts = category_counts[category_counts > 0].head(10)
     
     fig = go.Figure(data=[go.Bar(
         x=category_counts.values,
@@ -531,13 +716,69 @@ def create_category_chart(df):
     
     return fig
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def create_payment_chart(_df, data_key):
+    """Create payment type distribution chart"""
+    payment_counts = _df['Payment Type'].value_counts()
+    payment_counts = limit_pie_slices(payment_counts[payment_counts > 0])
+    
+    fig = go.Figure(data=[go.Pie(
+        labels=payment_counts.index,
+        values=payment_counts.values,
+        marker=dict(colors=['#4CAF50', '#FFEB3B', '#FF9800', '#FFC107']),
+        hole=0.4,
+        textfont=dict(color='#000000', size=14, family='Arial Black')
+    )])
+    fig.update_layout(title='Equipment by Payment Type', height=350)
+    
+    return fig
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def create_billing_chart(_df, data_key):
+    """Create billing basis distribution chart"""
+    billing_counts = _df['Billing Basis'].value_counts()
+    billing_counts = billing_counts[billing_counts > 0]
+    
+    fig = go.Figure(data=[go.Bar(
+        x=billing_counts.index,
+        y=billing_counts.values,
+        marker_color='#FF9800',
+        text=billing_counts.values,
+        textposition='outside',
+        textfont=dict(color='#000000', size=12, family='Arial Black')
+    )])
+    
+    fig.update_layout(
+        title='Equipment by Billing Basis',
+        xaxis_title='Billing Basis',
+        yaxis_title='Count',
+        height=350,
+        showlegend=False
+    )
+    
+    return fig
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_search_text(_df, data_key, columns):
+    """Build one lowercase search string per row across the given columns"""
+    # Join with a unit separator so a search term cannot match across two cells;
+    # empty cells become '' rather than 'nan'/'<NA>', so they neither blank out
+    # the row nor match searches for 'na'
+    search_text = pd.Series('', index=_df.index)
+    for col in columns:
+        search_text = search_text + '\x1f' + _df[col].astype(str).where(_df[col].notna(), '').str.lower()
+    return search_text
+
+def df_to_csv_bytes(df):
+    """Serialize a dataframe to CSV bytes for download, in DataFrame.to_csv's format"""
+    return df.to_csv(index=False).encode('utf-8')
+
 def generate_summary_report(df):
     """Generate summary report for download"""
     try:
         active_count = 0
         if 'Current Status' in df.columns:
-            status_series = df['Current Status'].astype(str).str.lower()
-            active_count = len(df[status_series.str.contains('active', na=False)])
+            active_count = count_status(df['Current Status'].value_counts(), 'active')
         
         total_vendors = df['Vendor'].nunique() if 'Vendor' in df.columns else 0
         total_cost = df['Estimated Total Cost'].sum() if 'Estimated Total Cost' in df.columns else 0
@@ -556,6 +797,35 @@ def generate_summary_report(df):
         return pd.DataFrame([{'Report Generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 
                               'Error': str(e)}])
 
+def generate_excel_report(df, vendor_summary):
+    """Generate multi-sheet Excel report for download"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        df.to_excel(writer, sheet_name='Equipment Data', index=False)
+        
+        if vendor_summary is not None:
+            vendor_summary.to_excel(writer, sheet_name='Vendor Summary', index=False)
+        
+        summary_df = generate_summary_report(df)
+        summary_df.to_excel(writer, sheet_name='Executive Summary', index=False)
+    
+    return output.getvalue()
+
+def prepare_download(label, name, key, build):
+    """Return download bytes once the user asks for them, else None"""
+    # Exports are only built on request and kept in session state until the
+    # data they were built from (key) changes
+    prepared = st.session_state.get(f'download_{name}')
+    if prepared is not None and prepared[0] == key:
+        return prepared[1]
+    
+    if st.button(f"⚙️ Prepare {label}", key=f'prepare_{name}', use_container_width=True):
+        data = build()
+        st.session_state[f'download_{name}'] = (key, data)
+        return data
+    
+    return None
+
 def main():
     # Header with Bird Construction branding
     col1, col2, col3 = st.columns([1, 3, 1])
@@ -579,6 +849,17 @@ def main():
             help="Upload your equipment tracking spreadsheet"
         )
         
+        # Column projection only applies to Excel reads, so CSV uploads don't get the option
+        dashboard_columns_only = False
+        if uploaded_file and uploaded_file.name.endswith(('.xlsx', '.xls')):
+            dashboard_columns_only = st.checkbox(
+                "Load dashboard columns only",
+                value=False,
+                help="Drops columns the charts and KPIs don't use after reading the sheet. "
+                     "Loading is only slightly faster (about 10% on wide sheets), and the "
+                     "dropped columns won't appear in Equipment Details or the exports"
+            )
+        
         if uploaded_file:
             st.markdown("<div class='success-box'>✅ File loaded successfully!</div>", unsafe_allow_html=True)
         
@@ -633,47 +914,58 @@ def main():
     
     # Load data
     try:
-        df = load_data(uploaded_file)
+        df, load_key = load_data(uploaded_file, dashboard_columns_only)
         
-        # Sidebar filters
+        # Sidebar filters; load_data stores these columns as categoricals,
+        # whose categories are already the sorted distinct values
         with st.sidebar:
             if 'Vendor' in df.columns:
-                vendors = ['All'] + sorted(df['Vendor'].dropna().unique().tolist())
+                vendors = ['All'] + df['Vendor'].cat.categories.tolist()
                 selected_vendor = st.selectbox("🏢 Vendor", vendors)
             else:
                 selected_vendor = 'All'
             
             if 'Current Status' in df.columns:
-                statuses = ['All'] + sorted(df['Current Status'].dropna().unique().tolist())
+                statuses = ['All'] + df['Current Status'].cat.categories.tolist()
                 selected_status = st.selectbox("📊 Status", statuses)
             else:
                 selected_status = 'All'
             
             if 'Category' in df.columns:
-                categories = ['All'] + sorted(df['Category'].dropna().unique().tolist())
+                categories = ['All'] + df['Category'].cat.categories.tolist()
                 selected_category = st.selectbox("🏷️ Category", categories)
             else:
                 selected_category = 'All'
             
             if 'Payment Type' in df.columns:
-                payment_types = ['All'] + sorted(df['Payment Type'].dropna().unique().tolist())
+                payment_types = ['All'] + df['Payment Type'].cat.categories.tolist()
                 selected_payment = st.selectbox("💰 Payment Type", payment_types)
             else:
                 selected_payment = 'All'
         
         # Apply filters
-        filtered_df = df.copy()
-        if selected_vendor != 'All':
-            filtered_df = filtered_df[filtered_df['Vendor'] == selected_vendor]
-        if selected_status != 'All':
-            filtered_df = filtered_df[filtered_df['Current Status'] == selected_status]
-        if selected_category != 'All':
-            filtered_df = filtered_df[filtered_df['Category'] == selected_category]
-        if selected_payment != 'All':
-            filtered_df = filtered_df[filtered_df['Payment Type'] == selected_payment]
+        filter_key = (selected_vendor, selected_status, selected_category, selected_payment)
+        filtered_df = filter_data(df, load_key, filter_key)
+        
+        # Cache key for everything derived from filtered_df; hashing the key is
+        # far cheaper than hashing the frame's contents on every rerun
+        data_key = (load_key, filter_key)
+        
+        # Reference time for this rerun, floored to the minute so cached
+        # KPIs and charts stay valid across quick successive interactions
+        now = pd.Timestamp.now().floor('min')
         
         # Calculate KPIs
-        kpis = calculate_kpis(filtered_df)
+        kpis = calculate_kpis(filtered_df, data_key, now)
+        
+        # Vendor summary shared by the Vendor Analytics and Download tabs
+        vendor_summary = None
+        vendor_summary_error = None
+        if 'Vendor' in filtered_df.columns:
+            try:
+                vendor_summary = calculate_vendor_summary(filtered_df, data_key)
+            except Exception as e:
+                vendor_summary_error = e
         
         # KPI Section
         st.markdown("### 📊 Key Performance Indicators")
@@ -708,12 +1000,12 @@ def main():
             col1, col2 = st.columns(2)
             
             with col1:
-                status_fig = create_status_chart(filtered_df)
+                status_fig = create_status_chart(filtered_df, data_key)
                 if status_fig:
                     st.plotly_chart(status_fig, use_container_width=True)
             
             with col2:
-                category_fig = create_category_chart(filtered_df)
+                category_fig = create_category_chart(filtered_df, data_key)
                 if category_fig:
                     st.plotly_chart(category_fig, use_container_width=True)
             
@@ -724,46 +1016,23 @@ def main():
                 col1, col2 = st.columns(2)
                 
                 with col1:
-                    payment_counts = filtered_df['Payment Type'].value_counts()
-                    fig = go.Figure(data=[go.Pie(
-                        labels=payment_counts.index,
-                        values=payment_counts.values,
-                        marker=dict(colors=['#4CAF50', '#FFEB3B', '#FF9800', '#FFC107']),
-                        hole=0.4,
-                        textfont=dict(color='#000000', size=14, family='Arial Black')
-                    )])
-                    fig.update_layout(title='Equipment by Payment Type', height=350)
-                    st.plotly_chart(fig, use_container_width=True)
+                    payment_fig = create_payment_chart(filtered_df, data_key)
+                    st.plotly_chart(payment_fig, use_container_width=True)
                 
                 with col2:
-                    billing_counts = filtered_df['Billing Basis'].value_counts()
-                    fig = go.Figure(data=[go.Bar(
-                        x=billing_counts.index,
-                        y=billing_counts.values,
-                        marker_color='#FF9800',
-                        text=billing_counts.values,
-                        textposition='outside',
-                        textfont=dict(color='#000000', size=12, family='Arial Black')
-                    )])
-                    fig.update_layout(
-                        title='Equipment by Billing Basis',
-                        xaxis_title='Billing Basis',
-                        yaxis_title='Count',
-                        height=350,
-                        showlegend=False
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
+                    billing_fig = create_billing_chart(filtered_df, data_key)
+                    st.plotly_chart(billing_fig, use_container_width=True)
             
             # Alerts Section
             if kpis['alerts'] > 0:
                 st.markdown("### ⚠️ Action Required")
                 
+                overdue_mask, over_duration_mask = find_alert_masks(filtered_df, now)
+                
                 # Check for overdue inspections
                 if 'Next Inspection Due' in filtered_df.columns:
                     try:
-                        inspection_dates = pd.to_datetime(filtered_df['Next Inspection Due'], errors='coerce')
-                        overdue_mask = inspection_dates < datetime.now()
-                        overdue = filtered_df[overdue_mask & inspection_dates.notna()]
+                        overdue = filtered_df[overdue_mask]
                         
                         if len(overdue) > 0:
                             st.markdown(f"""
@@ -786,8 +1055,7 @@ def main():
                 # Check for over duration items
                 if 'Duration Variance' in filtered_df.columns:
                     try:
-                        variance_numeric = pd.to_numeric(filtered_df['Duration Variance'], errors='coerce')
-                        over_duration = filtered_df[variance_numeric > 7]
+                        over_duration = filtered_df[over_duration_mask]
                         
                         if len(over_duration) > 0:
                             st.markdown(f"""
@@ -811,7 +1079,7 @@ def main():
         with tab2:
             st.markdown("### 🏢 Vendor Performance Analysis")
             
-            vendor_fig = create_vendor_chart(filtered_df)
+            vendor_fig = create_vendor_chart(filtered_df, data_key)
             if vendor_fig:
                 st.plotly_chart(vendor_fig, use_container_width=True)
             
@@ -819,32 +1087,38 @@ def main():
             if 'Vendor' in filtered_df.columns:
                 st.markdown("### 📊 Detailed Vendor Metrics")
                 
-                try:
-                    vendor_summary = filtered_df.groupby('Vendor', dropna=False).agg({
-                        'Equipment Description': 'count',
-                        'Estimated Total Cost': 'sum',
-                        'Days Onsite': 'mean'
-                    }).reset_index()
-                    
-                    vendor_summary.columns = ['Vendor', 'Equipment Count', 'Total Cost', 'Avg Days Onsite']
-                    vendor_summary = vendor_summary.sort_values('Total Cost', ascending=False)
-                    
-                    st.dataframe(
-                        vendor_summary.style.format({
-                            'Total Cost': '${:,.2f}',
-                            'Avg Days Onsite': '{:.1f}'
-                        }).background_gradient(subset=['Total Cost'], cmap='YlOrRd'),
-                        use_container_width=True,
-                        height=400
-                    )
-                except Exception as e:
-                    st.error(f"Unable to generate vendor summary: {str(e)}")
+                if vendor_summary is None:
+                    st.error(f"Unable to generate vendor summary: {str(vendor_summary_error)}")
+                else:
+                    try:
+                        # Formatting is done by the browser via column_config, not a
+                        # pandas Styler; the progress bar stands in for the cost gradient
+                        st.dataframe(
+                            vendor_summary,
+                            column_config={
+                                'Total Cost': st.column_config.ProgressColumn(
+                                    'Total Cost',
+                                    format='dollar',
+                                    min_value=0,
+                                    max_value=max(1.0, float(vendor_summary['Total Cost'].max()))
+                                ),
+                                'Avg Days Onsite': st.column_config.NumberColumn(format='%.1f')
+                            },
+                            use_container_width=True,
+                            hide_index=True,
+                            height=400
+                        )
+                    except Exception as e:
+                        st.error(f"Unable to generate vendor summary: {str(e)}")
         
         # TAB 3: Timeline
         with tab3:
             st.markdown("### 📅 Equipment Mobilization Timeline")
             
-            timeline_fig = create_timeline_chart(filtered_df)
+            show_all = st.checkbox("Show all equipment", value=False)
+            max_rows = None if show_all else st.slider("Max rows", 50, 1000, 200, step=50)
+            
+            timeline_fig = create_timeline_chart(filtered_df, data_key, now, max_rows)
             if timeline_fig:
                 st.plotly_chart(timeline_fig, use_container_width=True)
             else:
@@ -870,21 +1144,25 @@ def main():
                 # Search functionality
                 search = st.text_input("🔍 Search equipment", "")
                 
-                display_df = filtered_df[selected_columns].copy()
+                display_df = filtered_df[selected_columns]
                 
                 if search:
-                    # Convert all columns to string for searching
-                    search_df = display_df.astype(str)
-                    mask = search_df.apply(
-                        lambda x: x.str.contains(search, case=False, na=False)
-                    ).any(axis=1)
-                    display_df = display_df[mask]
+                    search_text = build_search_text(filtered_df, data_key, tuple(selected_columns))
+                    mask = search_text.str.contains(search.lower(), regex=False, na=False)
+                    display_df = display_df[mask.to_numpy()]
+                
+                # Only send one page of rows to the browser
+                page_size = 100
+                total_pages = max(1, (len(display_df) + page_size - 1) // page_size)
+                page = st.number_input("Page", min_value=1, max_value=total_pages, value=1, step=1)
+                start = (page - 1) * page_size
                 
-                st.markdown(f"**Showing {len(display_df)} of {len(filtered_df)} items**")
+                st.markdown(f"**Showing {len(display_df)} of {len(filtered_df)} items** (page {page} of {total_pages})")
                 
                 st.dataframe(
-                    display_df,
+                    display_df.iloc[start:start + page_size],
                     use_container_width=True,
+                    hide_index=True,
                     height=500
                 )
         
@@ -904,14 +1182,18 @@ def main():
                 st.markdown("### 📊 Filtered Equipment Data")
                 st.write(f"Current view: **{len(filtered_df)} items**")
                 
-                csv_data = filtered_df.to_csv(index=False)
-                st.download_button(
-                    label="📥 Download Filtered Data (CSV)",
-                    data=csv_data,
-                    file_name=f"equipment_filtered_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-                    mime="text/csv",
-                    use_container_width=True
+                csv_data = prepare_download(
+                    "Filtered Data", 'filtered_csv', data_key,
+                    lambda: df_to_csv_bytes(filtered_df)
                 )
+                if csv_data is not None:
+                    st.download_button(
+                        label="📥 Download Filtered Data (CSV)",
+                        data=csv_data,
+                        file_name=f"equipment_filtered_{now.strftime('%Y%m%d_%H%M')}.csv",
+                        mime="text/csv",
+                        use_container_width=True
+                    )
             
             # Download 2: Vendor Summary
             with col2:
@@ -919,24 +1201,16 @@ def main():
                 st.write("Performance metrics by vendor")
                 
                 if 'Vendor' in filtered_df.columns:
-                    try:
-                        vendor_summary = filtered_df.groupby('Vendor', dropna=False).agg({
-                            'Equipment Description': 'count',
-                            'Estimated Total Cost': 'sum',
-                            'Days Onsite': 'mean'
-                        }).reset_index()
-                        
-                        vendor_summary.columns = ['Vendor', 'Equipment Count', 'Total Cost', 'Avg Days Onsite']
-                        
-                        csv_vendor = vendor_summary.to_csv(index=False)
+                    if vendor_summary is not None:
+                        csv_vendor = df_to_csv_bytes(vendor_summary)
                         st.download_button(
                             label="📥 Download Vendor Report (CSV)",
                             data=csv_vendor,
-                            file_name=f"vendor_summary_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+                            file_name=f"vendor_summary_{now.strftime('%Y%m%d_%H%M')}.csv",
                             mime="text/csv",
                             use_container_width=True
                         )
-                    except Exception as e:
+                    else:
                         st.warning("Vendor summary not available")
                 else:
                     st.info("Vendor column not found in data")
@@ -947,12 +1221,12 @@ def main():
                 st.write("High-level KPI report")
                 
                 summary_df = generate_summary_report(filtered_df)
-                csv_summary = summary_df.to_csv(index=False)
+                csv_summary = df_to_csv_bytes(summary_df)
                 
                 st.download_button(
                     label="📥 Download Summary (CSV)",
                     data=csv_summary,
-                    file_name=f"executive_summary_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+                    file_name=f"executive_summary_{now.strftime('%Y%m%d_%H%M')}.csv",
                     mime="text/csv",
                     use_container_width=True
                 )
@@ -967,47 +1241,35 @@ def main():
                 st.write(f"Export all **{len(df)} equipment records** with all columns")
             
             with col2:
-                csv_full = df.to_csv(index=False)
-                st.download_button(
-                    label="📥 Download Complete Dataset",
-                    data=csv_full,
-                    file_name=f"equipment_complete_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-                    mime="text/csv",
-                    use_container_width=True
+                csv_full = prepare_download(
+                    "Complete Dataset", 'complete_csv', load_key,
+                    lambda: df_to_csv_bytes(df)
                 )
+                if csv_full is not None:
+                    st.download_button(
+                        label="📥 Download Complete Dataset",
+                        data=csv_full,
+                        file_name=f"equipment_complete_{now.strftime('%Y%m%d_%H%M')}.csv",
+                        mime="text/csv",
+                        use_container_width=True
+                    )
             
             # Download 5: Excel Format
             st.markdown("### 📊 Excel Format Export")
             
             try:
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    filtered_df.to_excel(writer, sheet_name='Equipment Data', index=False)
-                    
-                    if 'Vendor' in filtered_df.columns:
-                        try:
-                            vendor_summary = filtered_df.groupby('Vendor', dropna=False).agg({
-                                'Equipment Description': 'count',
-                                'Estimated Total Cost': 'sum',
-                                'Days Onsite': 'mean'
-                            }).reset_index()
-                            vendor_summary.columns = ['Vendor', 'Equipment Count', 'Total Cost', 'Avg Days Onsite']
-                            vendor_summary.to_excel(writer, sheet_name='Vendor Summary', index=False)
-                        except:
-                            pass
-                    
-                    summary_df = generate_summary_report(filtered_df)
-                    summary_df.to_excel(writer, sheet_name='Executive Summary', index=False)
-                
-                excel_data = output.getvalue()
-                
-                st.download_button(
-                    label="📥 Download Multi-Sheet Excel Report",
-                    data=excel_data,
-                    file_name=f"equipment_report_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
+                excel_data = prepare_download(
+                    "Multi-Sheet Excel Report", 'excel_report', data_key,
+                    lambda: generate_excel_report(filtered_df, vendor_summary)
                 )
+                if excel_data is not None:
+                    st.download_button(
+                        label="📥 Download Multi-Sheet Excel Report",
+                        data=excel_data,
+                        file_name=f"equipment_report_{now.strftime('%Y%m%d_%H%M')}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        use_container_width=True
+                    )
             except Exception as e:
                 st.error(f"Error generating Excel file: {str(e)}")
     